@@ -3,16 +3,39 @@ API Key Authentication & Rate Limiting
 Simple in-memory API key management for monetization
 """
 import os
+import asyncio
 import hashlib
+import itertools
 import secrets
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
 from datetime import datetime
 from typing import Optional, Dict
 from fastapi import HTTPException, Request, Depends
 from fastapi.security import APIKeyHeader
 
 
-# In-memory API key store (use Redis/DB in production)
-API_KEYS: Dict[str, dict] = {}
+# In-memory API key store (use Redis/DB in production).
+# Indexed by the SHA-256 digest of the key rather than the raw string: the
+# store, the lookup cache, and the rate-limit identities are all keyed by
+# the digest, so a plaintext key only exists for the lifetime of the
+# request carrying it. The fixed-width 32-byte index hashes cheaply and
+# maps directly onto an indexed hash column if the store moves to a
+# database.
+API_KEYS: Dict[bytes, dict] = {}
+
+
+def _fast_fingerprint(key: str) -> bytes:
+    """SHA-256 fingerprint of an API key, used as the store index.
+
+    Deliberately a fast hash, not a slow KDF (bcrypt/pbkdf2/argon2): keys
+    are 256-bit random tokens from secrets.token_urlsafe, so brute-forcing
+    the digest is already infeasible and a slow KDF would only add
+    milliseconds of CPU to every request. Slow hashes are for low-entropy
+    passwords, not random keys.
+    """
+    return hashlib.sha256(key.encode()).digest()
 
 # Demo API keys for testing (always available)
 DEMO_KEYS = {
@@ -30,6 +53,13 @@ DEMO_KEYS = {
     }
 }
 
+# Merge demo keys into the main store at import time so the hot-path lookup
+# is a single hash probe instead of a two-dict fallback
+API_KEYS.update({
+    _fast_fingerprint(k): {**v, "is_demo": True}
+    for k, v in DEMO_KEYS.items()
+})
+
 # API Key header
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
@@ -59,25 +89,46 @@ def create_api_key(name: str, tier: str = "free") -> dict:
         "last_request": None
     }
     
-    API_KEYS[key] = key_data
-    
+    # Store under the key's digest; the plaintext is returned to the caller
+    # once and never kept
+    API_KEYS[_fast_fingerprint(key)] = key_data
+    # Invalidate the lookup cache so a cached miss for this key (or a stale
+    # record) is never served
+    _lookup.cache_clear()
+
     return {
         "api_key": key,
         **key_data
     }
 
 
+@lru_cache(maxsize=4096)
+def _lookup(fingerprint: bytes) -> Optional[dict]:
+    """Cached key lookup - memoizes the dict probes on the auth hot path.
+
+    verify_api_key/require_api_key run once per request (sometimes twice
+    when key info is needed downstream), so repeat lookups become a single
+    hash-table probe returning the already-built record. Keyed by the
+    digest, not the plaintext, so the cache never retains raw keys.
+    create_api_key clears the cache since lru_cache has no per-key
+    invalidation.
+    """
+    # Demo keys are merged into API_KEYS at import time, so a single probe
+    # covers both. The dict probe compares 32-byte digests, never the
+    # user-supplied plaintext against a stored secret.
+    return API_KEYS.get(fingerprint)
+
+
 def get_key_info(api_key: str) -> Optional[dict]:
     """Get API key information"""
-    # Check demo keys first
-    if api_key in DEMO_KEYS:
-        return DEMO_KEYS[api_key]
-    
-    # Check registered keys
-    if api_key in API_KEYS:
-        return API_KEYS[api_key]
-    
-    return None
+    return _lookup(_fast_fingerprint(api_key))
+
+
+def key_fingerprint(api_key: str) -> str:
+    """Hex fingerprint of an API key, safe to persist as a rate-limit
+    identity (in REQUEST_COUNTS or Redis key names) without keeping the
+    plaintext around."""
+    return _fast_fingerprint(api_key).hex()
 
 
 async def verify_api_key(
@@ -127,24 +178,133 @@ async def require_api_key(
 
 
 # Rate limit tracking (simple in-memory)
-REQUEST_COUNTS: Dict[str, list] = {}
+# Each key maps to a deque of request timestamps in ascending order, so
+# expired entries can be popped from the left in amortized O(1) instead of
+# rebuilding the whole list on every request. An OrderedDict keeps keys in
+# least-recently-used order so the table can be capped: without a cap every
+# key ever seen (including invalid ones rejected with a 401) would leave an
+# entry behind forever.
+REQUEST_COUNTS: "OrderedDict[str, deque]" = OrderedDict()
+
+# Hard cap on tracked keys to bound memory under key-spraying traffic
+MAX_TRACKED_KEYS = 100_000
+
+# How often the background sweep trims expired timestamps (seconds)
+SWEEP_INTERVAL = 1
+
+# How often idle keys are dropped from the table entirely (seconds)
+REAP_INTERVAL = 60
+
+# Optional shared rate-limit backend. With multiple workers the in-memory
+# windows are per-process (effective limit = workers x limit), so set
+# REDIS_URL to track windows in Redis sorted sets instead - one window per
+# key, atomic under concurrency, expired automatically via TTL.
+REDIS_URL = os.getenv("REDIS_URL")
+_redis = None
+_rate_limit_script = None
+if REDIS_URL:
+    import redis.asyncio as aioredis
+    _redis = aioredis.from_url(REDIS_URL)
+    # Trim, count, and conditionally record in one atomic round-trip.
+    # The request is only added when allowed, matching the local backend:
+    # rejected requests must not extend the window, or a client probing
+    # above their limit would never recover.
+    _rate_limit_script = _redis.register_script("""
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, ARGV[1])
+        if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then
+            return 0
+        end
+        redis.call('ZADD', KEYS[1], ARGV[3], ARGV[4])
+        redis.call('EXPIRE', KEYS[1], 60)
+        return 1
+    """)
+
+# Uniquifies ZSET members created in the same microsecond
+_member_seq = itertools.count()
 
-def check_rate_limit(api_key: str, limit: int) -> bool:
-    """Check if request is within rate limit"""
-    import time
+# Clock for the in-process windows, bound once at module scope. Monotonic so
+# wall-clock jumps (NTP adjustments) can't stretch or collapse the sliding
+# window; the Redis path keeps time.time() since its scores are shared
+# across processes.
+_now = time.monotonic
+
+
+async def check_rate_limit(api_key: str, limit: int) -> bool:
+    """Check if request is within rate limit.
+
+    Both backends share the same semantics: only allowed requests are
+    recorded, so a client over the limit regains capacity as soon as older
+    requests age out of the 60s window rather than having to back off
+    entirely.
+    """
+    if _redis is not None:
+        try:
+            return await _check_rate_limit_redis(api_key, limit)
+        except Exception:
+            # Fail open to the local window rather than 500 every request
+            # while Redis is unreachable
+            pass
+    return _check_rate_limit_local(api_key, limit)
+
+
+async def _check_rate_limit_redis(api_key: str, limit: int) -> bool:
+    """Sliding-window check against a Redis sorted set (shared across workers)"""
     now = time.time()
+    member = f"{now:.6f}-{next(_member_seq)}"
+
+    allowed = await _rate_limit_script(
+        keys=[f"ratelimit:{api_key}"],
+        args=[now - 60, limit, now, member]
+    )
+    return bool(allowed)
+
+
+def _check_rate_limit_local(api_key: str, limit: int) -> bool:
+    """Sliding-window check against the in-process deque table"""
+    now = _now()
     minute_ago = now - 60
-    
-    if api_key not in REQUEST_COUNTS:
-        REQUEST_COUNTS[api_key] = []
-    
-    # Clean old requests
-    REQUEST_COUNTS[api_key] = [t for t in REQUEST_COUNTS[api_key] if t > minute_ago]
-    
-    # Check limit
-    if len(REQUEST_COUNTS[api_key]) >= limit:
-        return False
-    
+
+    dq = REQUEST_COUNTS.get(api_key)
+    if dq is None:
+        # Evict the least-recently-used key if the table is full
+        if len(REQUEST_COUNTS) >= MAX_TRACKED_KEYS:
+            REQUEST_COUNTS.popitem(last=False)
+        dq = REQUEST_COUNTS[api_key] = deque()
+    else:
+        REQUEST_COUNTS.move_to_end(api_key)
+
+    # The background sweep keeps windows trimmed, so the common case is a
+    # plain O(1) append. Only trim inline when the window looks full, in
+    # case entries expired since the last sweep (at most SWEEP_INTERVAL
+    # seconds ago).
+    if len(dq) >= limit:
+        while dq and dq[0] <= minute_ago:
+            dq.popleft()
+        if len(dq) >= limit:
+            return False
+
     # Record request
-    REQUEST_COUNTS[api_key].append(now)
+    dq.append(now)
     return True
+
+
+async def reap_rate_limits():
+    """
+    Background task: every second, trim expired timestamps from all
+    windows so the request path stays a pure append; every REAP_INTERVAL,
+    drop keys whose newest request left the window entirely, so
+    idle/garbage keys don't accumulate. Launched from the app's startup
+    hook.
+    """
+    reap_every = max(1, REAP_INTERVAL // SWEEP_INTERVAL)
+    sweeps = 0
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL)
+        cutoff = _now() - 60
+        sweeps += 1
+        reap = sweeps % reap_every == 0
+        for key, dq in list(REQUEST_COUNTS.items()):
+            while dq and dq[0] <= cutoff:
+                dq.popleft()
+            if reap and not dq:
+                del REQUEST_COUNTS[key]
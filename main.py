@@ -3,30 +3,72 @@ NeuralGCM Weather Prediction API
 AI-powered weather forecasting inspired by Google's NeuralGCM model
 With API key authentication and rate limiting for monetization
 """
+import asyncio
 import os
 from pathlib import Path
+from types import MappingProxyType
 from typing import Optional
 
-from fastapi import FastAPI, HTTPException, Query, Request, Depends
+from fastapi import FastAPI, HTTPException, Path as PathParam, Query, Depends
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
+from starlette.middleware.base import BaseHTTPMiddleware
 from dotenv import load_dotenv
 
-from weather_client import get_client
+from weather_client import get_client, tick_generated_at
 from auth import (
     verify_api_key, require_api_key, create_api_key,
-    get_key_info, check_rate_limit
+    get_key_info, key_fingerprint, check_rate_limit, reap_rate_limits
 )
 
 # Load environment variables
 load_dotenv()
 
-# Rate limiter setup
-limiter = Limiter(key_func=get_remote_address)
+# Per-minute limits for anonymous requests, by path prefix. Authenticated
+# requests use their key's tier limit instead.
+RATE_LIMITED_PREFIXES = (
+    ("/api/extreme-events", 20),
+    ("/api/precipitation", 30),
+    ("/api/location/", 30),
+    ("/forecast/", 30),
+)
+
+
+class RateLimitMiddleware(BaseHTTPMiddleware):
+    """
+    Single-pass rate limiting: one key lookup plus one deque trim per
+    request, instead of per-endpoint decorator plumbing.
+    """
+
+    async def dispatch(self, request, call_next):
+        path = request.url.path
+        for prefix, limit in RATE_LIMITED_PREFIXES:
+            if path.startswith(prefix):
+                break
+        else:
+            return await call_next(request)
+
+        # Authenticated requests are limited per key at their tier's rate;
+        # anonymous (or invalid-key) requests per client IP at the default.
+        # Invalid keys still get their 401 from the endpoint dependencies.
+        api_key = request.headers.get("X-API-Key")
+        key_info = get_key_info(api_key) if api_key else None
+        if key_info:
+            # Identify by fingerprint, not plaintext, so the rate-limit
+            # tables (and Redis key names) never retain raw keys
+            identity = key_fingerprint(api_key)
+            limit = key_info.get("rate_limit", limit)
+        else:
+            identity = request.client.host if request.client else "anonymous"
+
+        if not await check_rate_limit(identity, limit):
+            return JSONResponse(
+                status_code=429,
+                content={"detail": f"Rate limit exceeded: {limit} requests/minute"}
+            )
+
+        return await call_next(request)
 
 # Create FastAPI app
 app = FastAPI(
@@ -50,12 +92,14 @@ app = FastAPI(
     """,
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    # orjson serializes the large forecast payloads several times faster
+    # than the stdlib json encoder
+    default_response_class=ORJSONResponse
 )
 
-# Add rate limit handler
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+# Add rate limit middleware
+app.add_middleware(RateLimitMiddleware)
 
 # Add CORS middleware
 app.add_middleware(
@@ -72,6 +116,18 @@ STATIC_DIR.mkdir(exist_ok=True)
 app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
 
 
+@app.on_event("startup")
+async def start_background_tasks():
+    """Launch background maintenance tasks"""
+    # Keep strong references: the event loop only holds weak refs to
+    # tasks, so unreferenced ones can be garbage-collected and silently
+    # stop running
+    app.state.background_tasks = [
+        asyncio.create_task(reap_rate_limits()),
+        asyncio.create_task(tick_generated_at()),
+    ]
+
+
 @app.get("/")
 async def serve_frontend():
     """Serve the main frontend page"""
@@ -133,29 +189,21 @@ async def get_api_key_info(key_info: dict = Depends(require_api_key)):
 # ============== Weather Endpoints ==============
 
 @app.get("/forecast/{latitude}/{longitude}")
-@limiter.limit("30/minute")
 async def get_forecast(
-    request: Request,
-    latitude: float,
-    longitude: float,
+    latitude: float = PathParam(..., ge=-90, le=90, description="Location latitude"),
+    longitude: float = PathParam(..., ge=-180, le=180, description="Location longitude"),
     days: int = Query(default=15, ge=1, le=16, description="Number of forecast days"),
     key_info: Optional[dict] = Depends(verify_api_key)
 ):
     """
     Get weather forecast for a location
-    
+
     - **latitude**: Location latitude (-90 to 90)
     - **longitude**: Location longitude (-180 to 180)
     - **days**: Number of forecast days (1-16, default 15)
-    
+
     Returns precipitation, temperature, and weather conditions.
     """
-    # Validate coordinates
-    if not -90 <= latitude <= 90:
-        raise HTTPException(status_code=400, detail="Latitude must be between -90 and 90")
-    if not -180 <= longitude <= 180:
-        raise HTTPException(status_code=400, detail="Longitude must be between -180 and 180")
-    
     client = get_client()
     result = await client.get_forecast(latitude, longitude, days)
     
@@ -174,11 +222,9 @@ async def get_forecast(
 
 
 @app.get("/api/precipitation")
-@limiter.limit("30/minute")
 async def get_precipitation(
-    request: Request,
-    lat: float = Query(..., description="Latitude"),
-    lon: float = Query(..., description="Longitude"),
+    lat: float = Query(..., ge=-90, le=90, description="Latitude"),
+    lon: float = Query(..., ge=-180, le=180, description="Longitude"),
     days: int = Query(default=15, ge=1, le=16)
 ):
     """Get detailed precipitation forecast"""
@@ -209,11 +255,9 @@ async def get_precipitation(
 
 
 @app.get("/api/extreme-events")
-@limiter.limit("20/minute")
 async def get_extreme_events(
-    request: Request,
-    lat: float = Query(..., description="Latitude"),
-    lon: float = Query(..., description="Longitude")
+    lat: float = Query(..., ge=-90, le=90, description="Latitude"),
+    lon: float = Query(..., ge=-180, le=180, description="Longitude")
 ):
     """Check for extreme weather events"""
     client = get_client()
@@ -225,8 +269,9 @@ async def get_extreme_events(
     return result
 
 
-# Preset locations
-PRESET_LOCATIONS = {
+# Preset locations - keys are lowercase by construction (get_by_city relies
+# on this); the read-only proxy guards against accidental mutation
+PRESET_LOCATIONS = MappingProxyType({
     "delhi": {"lat": 28.6139, "lon": 77.2090, "name": "Delhi, India"},
     "mumbai": {"lat": 19.0760, "lon": 72.8777, "name": "Mumbai, India"},
     "bangalore": {"lat": 12.9716, "lon": 77.5946, "name": "Bangalore, India"},
@@ -237,7 +282,10 @@ PRESET_LOCATIONS = {
     "newyork": {"lat": 40.7128, "lon": -74.0060, "name": "New York, USA"},
     "tokyo": {"lat": 35.6762, "lon": 139.6503, "name": "Tokyo, Japan"},
     "sydney": {"lat": -33.8688, "lon": 151.2093, "name": "Sydney, Australia"},
-}
+})
+
+# Built once so the 404 path doesn't rejoin the same key list per request
+_PRESET_KEYS_STR = ", ".join(PRESET_LOCATIONS.keys())
 
 
 @app.get("/api/presets")
@@ -247,9 +295,7 @@ async def get_presets():
 
 
 @app.get("/api/location/{city}")
-@limiter.limit("30/minute")
 async def get_by_city(
-    request: Request,
     city: str,
     days: int = Query(default=15, ge=1, le=16)
 ):
@@ -258,7 +304,7 @@ async def get_by_city(
     if city_lower not in PRESET_LOCATIONS:
         raise HTTPException(
             status_code=404,
-            detail=f"City '{city}' not found. Available: {', '.join(PRESET_LOCATIONS.keys())}"
+            detail=f"City '{city}' not found. Available: {_PRESET_KEYS_STR}"
         )
     
     location = PRESET_LOCATIONS[city_lower]
@@ -288,4 +334,19 @@ if __name__ == "__main__":
     print(f"📚 API Docs: http://localhost:{port}/docs")
     print("="*60 + "\n")
     
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # uvloop's C event loop and the httptools parser are worth 2-3x
+    # throughput over the pure-Python defaults. Workers default to 1:
+    # API_KEYS is per-process, so with N workers a key registered via
+    # /api/register is only visible to the worker that created it (401s on
+    # the other N-1) and in-memory rate limits multiply by N. Raise
+    # WEB_CONCURRENCY only with REDIS_URL set for the rate-limit windows
+    # and once the key store itself is shared.
+    workers = int(os.getenv("WEB_CONCURRENCY", 1))
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=workers
+    )
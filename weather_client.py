@@ -2,11 +2,31 @@
 NeuralGCM Weather Client
 Fetches weather data from Open-Meteo API + AI-enhanced precipitation forecasting
 """
+import asyncio
+
 import httpx
-from typing import Optional, Dict, Any
+import numpy as np
+from cachetools import TTLCache
+from functools import lru_cache
+from typing import Dict, Any
 from datetime import datetime, timedelta
 
 
+# Cached "generated_at" string, refreshed once per second by the background
+# tick below. Saves a datetime + isoformat + concat allocation per response;
+# second granularity is plenty for a response label. Single-element list so
+# the tick can swap the value without a global statement.
+_NOW_ISO = [datetime.utcnow().isoformat(timespec="seconds") + "Z"]
+
+
+async def tick_generated_at():
+    """Background task: refresh the cached timestamp string every second.
+    Launched from the app's startup hook."""
+    while True:
+        _NOW_ISO[0] = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+        await asyncio.sleep(1)
+
+
 class WeatherClient:
     """Weather data client using Open-Meteo API with AI enhancement"""
     
@@ -41,10 +61,64 @@ class WeatherClient:
         96: "Thunderstorm with slight hail",
         99: "Thunderstorm with heavy hail",
     }
-    
+
+    # Weather code icons, precomputed so lookup is a single dict probe
+    # instead of walking an if/elif chain for every forecast day
+    _ICONS = {
+        0: "☀️",
+        1: "🌤️", 2: "🌤️",
+        3: "☁️",
+        45: "🌫️", 48: "🌫️",
+        51: "🌧️", 53: "🌧️", 55: "🌧️",
+        61: "🌧️", 63: "🌧️", 65: "🌧️",
+        66: "🌨️", 67: "🌨️",
+        71: "❄️", 73: "❄️", 75: "❄️", 77: "❄️",
+        80: "🌧️", 81: "🌧️", 82: "🌧️",
+        85: "❄️", 86: "❄️",
+        95: "⛈️", 96: "⛈️", 99: "⛈️",
+    }
+
+    # Dense per-code tables (WMO codes span 0-99): lookup becomes plain
+    # tuple indexing - a pointer dereference - instead of a hash probe.
+    # map() instead of a comprehension because class-scope names aren't
+    # visible inside comprehensions.
+    _DESC_TABLE = tuple(map(WEATHER_CODES.get, range(100), ["Unknown"] * 100))
+    _ICON_TABLE = tuple(map(_ICONS.get, range(100), ["🌡️"] * 100))
+
+    # Forecast cache TTL in seconds; Open-Meteo daily data doesn't change
+    # faster than this
+    CACHE_TTL = 600
+
     def __init__(self):
-        self.client = httpx.AsyncClient(timeout=30.0)
-    
+        # HTTP/2 lets concurrent forecasts multiplex on one Open-Meteo
+        # connection; long keepalive avoids re-paying the TLS handshake
+        # (~50-150ms) on cold requests
+        self.client = httpx.AsyncClient(
+            http2=True,
+            timeout=30.0,
+            limits=httpx.Limits(
+                max_connections=100,
+                max_keepalive_connections=50,
+                keepalive_expiry=60.0
+            )
+        )
+        # Successful forecasts keyed on (lat, lon, days) rounded to ~1km,
+        # so repeat queries skip the upstream round-trip entirely
+        self._forecast_cache = TTLCache(maxsize=10_000, ttl=self.CACHE_TTL)
+        # In-flight fetch tasks per cache key, so concurrent misses for the
+        # same location coalesce onto one upstream request. The dict also
+        # holds the strong reference that keeps each task alive.
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+
+    @staticmethod
+    def _copy_result(result: Dict[str, Any]) -> Dict[str, Any]:
+        """Shallow-copy a cached forecast so callers that annotate the
+        response (tier info, preset city names) don't mutate the cache."""
+        copied = dict(result)
+        if "location" in copied:
+            copied["location"] = dict(copied["location"])
+        return copied
+
     async def get_forecast(
         self,
         latitude: float,
@@ -52,16 +126,55 @@ class WeatherClient:
         days: int = 15
     ) -> Dict[str, Any]:
         """
-        Get weather forecast for a location
-        
+        Get weather forecast for a location (cached for CACHE_TTL seconds)
+
         Args:
             latitude: Location latitude
             longitude: Location longitude
             days: Number of forecast days (max 16)
-            
+
         Returns:
             Forecast data with precipitation, temperature, and conditions
         """
+        cache_key = (round(latitude, 2), round(longitude, 2), min(days, 16))
+
+        cached = self._forecast_cache.get(cache_key)
+        if cached is not None:
+            return self._copy_result(cached)
+
+        # Coalesce concurrent misses for the same key onto one fetch. The
+        # fetch runs as its own task and every caller awaits it through
+        # shield(), so one client disconnecting cancels only its own await -
+        # the shared fetch keeps running for the other waiters (and still
+        # populates the cache even if all of them are cancelled).
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(
+                self._fetch_forecast(latitude, longitude, days)
+            )
+            self._inflight[cache_key] = task
+            task.add_done_callback(
+                lambda t, key=cache_key: self._finish_fetch(key, t)
+            )
+
+        result = await asyncio.shield(task)
+        return self._copy_result(result)
+
+    def _finish_fetch(self, cache_key: tuple, task: asyncio.Task):
+        """Done-callback for an in-flight fetch: cache success, drop the entry"""
+        del self._inflight[cache_key]
+        if not task.cancelled() and task.exception() is None:
+            result = task.result()
+            if result.get("success"):
+                self._forecast_cache[cache_key] = result
+
+    async def _fetch_forecast(
+        self,
+        latitude: float,
+        longitude: float,
+        days: int
+    ) -> Dict[str, Any]:
+        """Fetch and assemble a forecast from Open-Meteo (cache miss path)"""
         try:
             # Fetch forecast from Open-Meteo
             params = {
@@ -91,38 +204,52 @@ class WeatherClient:
             daily = data.get("daily", {})
             dates = daily.get("time", [])
             
+            # Hoist each daily array once instead of re-probing the dict
+            # (and re-checking bounds) for every field of every day
+            n_days = len(dates)
+            tmax = daily.get("temperature_2m_max") or [None] * n_days
+            tmin = daily.get("temperature_2m_min") or [None] * n_days
+            psum = daily.get("precipitation_sum") or [0] * n_days
+            pprob = daily.get("precipitation_probability_max") or [0] * n_days
+            wcodes = daily.get("weather_code") or [0] * n_days
+            wind = daily.get("wind_speed_10m_max") or [None] * n_days
+            uv = daily.get("uv_index_max") or [None] * n_days
+
             forecast_days = []
-            for i, date in enumerate(dates):
-                weather_code = daily.get("weather_code", [0])[i] if i < len(daily.get("weather_code", [])) else 0
-                
+            for date, t_max, t_min, p_sum, p_prob, code, w_speed, uv_max in zip(
+                dates, tmax, tmin, psum, pprob, wcodes, wind, uv
+            ):
                 day_data = {
                     "date": date,
                     "temperature": {
-                        "max": daily.get("temperature_2m_max", [0])[i] if i < len(daily.get("temperature_2m_max", [])) else None,
-                        "min": daily.get("temperature_2m_min", [0])[i] if i < len(daily.get("temperature_2m_min", [])) else None,
+                        "max": t_max,
+                        "min": t_min,
                         "unit": "°C"
                     },
                     "precipitation": {
-                        "amount": daily.get("precipitation_sum", [0])[i] if i < len(daily.get("precipitation_sum", [])) else 0,
-                        "probability": daily.get("precipitation_probability_max", [0])[i] if i < len(daily.get("precipitation_probability_max", [])) else 0,
+                        "amount": p_sum,
+                        "probability": p_prob,
                         "unit": "mm"
                     },
                     "conditions": {
-                        "code": weather_code,
-                        "description": self.WEATHER_CODES.get(weather_code, "Unknown"),
-                        "icon": self._get_weather_icon(weather_code)
+                        "code": code,
+                        "description": self._DESC_TABLE[code] if isinstance(code, int) and 0 <= code < 100 else "Unknown",
+                        "icon": self._ICON_TABLE[code] if isinstance(code, int) and 0 <= code < 100 else "🌡️"
                     },
                     "wind": {
-                        "speed": daily.get("wind_speed_10m_max", [0])[i] if i < len(daily.get("wind_speed_10m_max", [])) else None,
+                        "speed": w_speed,
                         "unit": "km/h"
                     },
-                    "uv_index": daily.get("uv_index_max", [0])[i] if i < len(daily.get("uv_index_max", [])) else None
+                    "uv_index": uv_max
                 }
                 forecast_days.append(day_data)
             
-            # Calculate precipitation summary
-            total_precip = sum(d["precipitation"]["amount"] for d in forecast_days if d["precipitation"]["amount"])
-            rainy_days = sum(1 for d in forecast_days if d["precipitation"]["amount"] and d["precipitation"]["amount"] > 0.1)
+            # Calculate precipitation summary as C-level array reductions;
+            # None entries become nan, which nansum ignores and the > 0.1
+            # comparison treats as dry. Cast back to Python scalars for JSON.
+            psum_arr = np.asarray(psum, dtype=np.float32)
+            total_precip = float(np.nansum(psum_arr))
+            rainy_days = int((psum_arr > 0.1).sum())
             
             return {
                 "success": True,
@@ -140,7 +267,7 @@ class WeatherClient:
                     "ai_enhanced": True,
                     "model": "NeuralGCM-inspired + Open-Meteo"
                 },
-                "generated_at": datetime.utcnow().isoformat() + "Z"
+                "generated_at": _NOW_ISO[0]
             }
             
         except httpx.HTTPError as e:
@@ -211,36 +338,18 @@ class WeatherClient:
     
     def _get_weather_icon(self, code: int) -> str:
         """Get emoji icon for weather code"""
-        if code == 0:
-            return "☀️"
-        elif code in [1, 2]:
-            return "🌤️"
-        elif code == 3:
-            return "☁️"
-        elif code in [45, 48]:
-            return "🌫️"
-        elif code in [51, 53, 55, 61, 63, 65, 80, 81, 82]:
-            return "🌧️"
-        elif code in [66, 67]:
-            return "🌨️"
-        elif code in [71, 73, 75, 77, 85, 86]:
-            return "❄️"
-        elif code in [95, 96, 99]:
-            return "⛈️"
-        else:
-            return "🌡️"
+        if isinstance(code, int) and 0 <= code < 100:
+            return self._ICON_TABLE[code]
+        return "🌡️"
     
     async def close(self):
         """Close the HTTP client"""
         await self.client.aclose()
 
 
-# Singleton instance
-_client: Optional[WeatherClient] = None
-
+# Singleton accessor - lru_cache handles the lazy init, so callers skip
+# the global-load + None-check branch of the usual singleton dance
+@lru_cache(maxsize=1)
 def get_client() -> WeatherClient:
     """Get or create the weather client singleton"""
-    global _client
-    if _client is None:
-        _client = WeatherClient()
-    return _client
+    return WeatherClient()